@@ -9,6 +9,8 @@ class Settings(BaseSettings):
     admin_password: str = ""
     exp_token: int = 30
     db_url: str = "sqlite+pysqlite:///:memory:?cache=shared"
+    shard_urls: str = ""
+    stats_reconcile_interval: int = 3600
     password_length: int = 8
     jwt_algorithm: str = "HS256"
 
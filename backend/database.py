@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -6,18 +7,35 @@ from app.config import get_settings
 
 settings = get_settings()
 
-engine_kwargs = {}
-if settings.db_url.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
-    # Ensure in-memory SQLite is shared across all sessions/connections.
-    if ":memory:" in settings.db_url:
-        connect_args["uri"] = True
-        engine_kwargs["poolclass"] = StaticPool
-    engine_kwargs["connect_args"] = connect_args
 
-engine = create_engine(settings.db_url, **engine_kwargs)
+def make_engine(db_url: str) -> Engine:
+    engine_kwargs = {}
+    if db_url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        # Ensure in-memory SQLite is shared across all sessions/connections.
+        if ":memory:" in db_url:
+            connect_args["uri"] = True
+            engine_kwargs["poolclass"] = StaticPool
+        engine_kwargs["connect_args"] = connect_args
+    return create_engine(db_url, **engine_kwargs)
+
+
+# The primary database holds users and the shard directory.
+engine = make_engine(settings.db_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Project shards. Without SHARD_URLS everything lives in the primary database.
+shard_urls = [url.strip() for url in settings.shard_urls.split(",") if url.strip()]
+shard_engines = [make_engine(url) for url in shard_urls] or [engine]
+ShardSessions = [
+    sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+    for shard_engine in shard_engines
+]
+
 
 class Base(DeclarativeBase):
     pass
+
+
+class ShardBase(DeclarativeBase):
+    pass
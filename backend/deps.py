@@ -5,12 +5,19 @@ from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app.models import User
 from app.security import AuthError, decode_token
+from app.sharding import (
+    ShardBusyError,
+    ShardNotConfiguredError,
+    find_project_owner,
+    resolve_shard,
+    shard_session,
+)
 
 # Keep token URL relative so Swagger/OpenAPI respects root_path (e.g. /subtitles-admin).
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-def get_db():
+def get_user_db():
     db = SessionLocal()
     try:
         yield db
@@ -18,7 +25,9 @@ def get_db():
         db.close()
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_user_db)
+) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -39,3 +48,43 @@ def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.admin:
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return current_user
+
+
+def resolve_shard_or_503(user_db: Session, user_id: int) -> int:
+    try:
+        return resolve_shard(user_db, user_id)
+    except ShardBusyError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Projects are being moved, retry shortly",
+            headers={"Retry-After": "5"},
+        ) from exc
+    except ShardNotConfiguredError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{exc}; restore its URL and run app.rebalance to move the user",
+        ) from exc
+
+
+def get_db(
+    current_user: User = Depends(get_current_user),
+    user_db: Session = Depends(get_user_db),
+):
+    """Session on the shard holding the authenticated user's projects."""
+    with shard_session(resolve_shard_or_503(user_db, current_user.id)) as db:
+        yield db
+
+
+def get_project_db(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    user_db: Session = Depends(get_user_db),
+):
+    """Session on the shard holding ``project_id``; non-admins only get their own shard."""
+    owner_id = current_user.id
+    if current_user.admin:
+        owner_id = find_project_owner(project_id)
+        if owner_id is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+    with shard_session(resolve_shard_or_503(user_db, owner_id)) as db:
+        yield db
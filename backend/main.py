@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
@@ -8,10 +9,18 @@ from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.database import Base, engine
-from app.deps import get_admin_user, get_current_user, get_db
-from app.models import Project, User
+from app.database import Base, ShardBase, engine, shard_engines
+from app.deps import (
+    get_admin_user,
+    get_current_user,
+    get_db,
+    get_project_db,
+    get_user_db,
+    resolve_shard_or_503,
+)
+from app.models import Project, ProjectStats, User
 from app.schemas import (
+    AdminStatsOut,
     MeOut,
     ProjectCreate,
     ProjectOut,
@@ -19,6 +28,7 @@ from app.schemas import (
     Token,
     UserCreate,
     UserOut,
+    UserStatsOut,
     UserUpdate,
 )
 from app.security import (
@@ -27,6 +37,14 @@ from app.security import (
     get_password_hash,
     verify_password,
 )
+from app.sharding import (
+    allocate_project_id,
+    change_project_owner,
+    fan_out_owned,
+    seed_project_ids,
+    shard_session,
+)
+from app.stats import data_size, reconcile_stats_periodically, record_project_change
 
 settings = get_settings()
 
@@ -34,10 +52,13 @@ settings = get_settings()
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     Base.metadata.create_all(bind=engine)
+    for shard_engine in shard_engines:
+        ShardBase.metadata.create_all(bind=shard_engine)
     from app.database import SessionLocal
 
     db = SessionLocal()
     try:
+        seed_project_ids(db)
         admin_user = db.query(User).filter(User.protected_admin.is_(True)).first()
         if admin_user is None:
             admin_password = settings.admin_password.strip()
@@ -69,7 +90,15 @@ async def lifespan(_: FastAPI):
                 )
     finally:
         db.close()
+
+    reconcile_task = None
+    if settings.stats_reconcile_interval > 0:
+        reconcile_task = asyncio.create_task(
+            reconcile_stats_periodically(settings.stats_reconcile_interval)
+        )
     yield
+    if reconcile_task is not None:
+        reconcile_task.cancel()
 
 
 app = FastAPI(title="Subtitles API", lifespan=lifespan, docs_url=None)
@@ -216,7 +245,7 @@ async def refresh_token_middleware(request, call_next):
 
 
 @app.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_user_db)):
     user = (
         db.query(User)
         .filter(User.username == form_data.username, User.is_deleted.is_(False))
@@ -237,12 +266,12 @@ def me(current_user: User = Depends(get_current_user)):
 
 
 @app.get("/users", response_model=list[UserOut])
-def list_users(_: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+def list_users(_: User = Depends(get_admin_user), db: Session = Depends(get_user_db)):
     return db.query(User).filter(User.is_deleted.is_(False)).all()
 
 
 @app.get("/users/{user_id}", response_model=UserOut)
-def get_user(user_id: int, _: User = Depends(get_admin_user), db: Session = Depends(get_db)):
+def get_user(user_id: int, _: User = Depends(get_admin_user), db: Session = Depends(get_user_db)):
     user = db.get(User, user_id)
     if not user or user.is_deleted:
         raise HTTPException(status_code=404, detail="User not found")
@@ -253,7 +282,7 @@ def get_user(user_id: int, _: User = Depends(get_admin_user), db: Session = Depe
 def create_user(
     payload: UserCreate,
     _: User = Depends(get_admin_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
 ):
     if len(payload.password) < settings.password_length:
         raise HTTPException(
@@ -287,7 +316,7 @@ def update_user(
     user_id: int,
     payload: UserUpdate,
     _: User = Depends(get_admin_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
 ):
     user = db.get(User, user_id)
     if not user or user.is_deleted:
@@ -330,7 +359,7 @@ def update_user(
 def delete_user(
     user_id: int,
     _: User = Depends(get_admin_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_user_db),
 ):
     user = db.get(User, user_id)
     if not user or user.is_deleted:
@@ -347,24 +376,40 @@ def delete_user(
 
 
 @app.get("/projects", response_model=list[ProjectOut])
-def list_projects(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    query = db.query(Project).filter(Project.is_deleted.is_(False))
-    if not current_user.admin:
-        query = query.filter(Project.user_id == current_user.id)
-    return query.all()
+def list_projects(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    user_db: Session = Depends(get_user_db),
+):
+    if current_user.admin:
+        projects = fan_out_owned(
+            user_db,
+            lambda shard_db: shard_db.query(Project).filter(Project.is_deleted.is_(False)).all(),
+        )
+        unique = {project.id: project for project in projects}
+        return sorted(unique.values(), key=lambda project: project.id)
+    return (
+        db.query(Project)
+        .filter(Project.is_deleted.is_(False), Project.user_id == current_user.id)
+        .all()
+    )
 
 
 @app.get("/projects/{project_id}", response_model=ProjectOut)
 def get_project(
     project_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_project_db),
 ):
     project = db.get(Project, project_id)
-    if not project or project.is_deleted:
+    # Non-admins only reach their own shard, so other users' projects are
+    # reported as missing wherever they live.
+    if (
+        not project
+        or project.is_deleted
+        or (not current_user.admin and project.user_id != current_user.id)
+    ):
         raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.admin and project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
     return project
 
 
@@ -372,21 +417,27 @@ def get_project(
 def create_project(
     payload: ProjectCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    user_db: Session = Depends(get_user_db),
 ):
     owner_id = payload.user_id if payload.user_id is not None else current_user.id
     if payload.user_id is not None and not current_user.admin:
         raise HTTPException(status_code=403, detail="Only admins can set project owner")
 
-    owner = db.get(User, owner_id)
+    owner = user_db.get(User, owner_id)
     if not owner or owner.is_deleted:
         raise HTTPException(status_code=404, detail="Owner user not found")
 
-    project = Project(name=payload.name, data=payload.data, user_id=owner_id, is_deleted=False)
-    db.add(project)
-    db.commit()
-    db.refresh(project)
-    return project
+    shard = resolve_shard_or_503(user_db, owner_id)
+    project_id = allocate_project_id(user_db)
+    with shard_session(shard) as db:
+        project = Project(
+            id=project_id, name=payload.name, data=payload.data, user_id=owner_id, is_deleted=False
+        )
+        db.add(project)
+        record_project_change(db, owner_id, projects=1, data_bytes=data_size(payload.data))
+        db.commit()
+        db.refresh(project)
+        return project
 
 
 @app.patch("/projects/{project_id}", response_model=ProjectOut)
@@ -394,27 +445,34 @@ def update_project(
     project_id: int,
     payload: ProjectUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_project_db),
+    user_db: Session = Depends(get_user_db),
 ):
     project = db.get(Project, project_id)
-    if not project or project.is_deleted:
+    if (
+        not project
+        or project.is_deleted
+        or (not current_user.admin and project.user_id != current_user.id)
+    ):
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if not current_user.admin and project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-
+    data_bytes = 0
     if payload.name is not None:
         project.name = payload.name
     if payload.data is not None:
+        data_bytes = data_size(payload.data) - data_size(project.data)
         project.data = payload.data
+    record_project_change(db, project.user_id, data_bytes=data_bytes)
 
     if payload.user_id is not None:
         if not current_user.admin:
             raise HTTPException(status_code=403, detail="Only admins can change project owner")
-        owner = db.get(User, payload.user_id)
+        owner = user_db.get(User, payload.user_id)
         if not owner or owner.is_deleted:
             raise HTTPException(status_code=404, detail="Owner user not found")
-        project.user_id = payload.user_id
+        if payload.user_id != project.user_id:
+            shard = resolve_shard_or_503(user_db, payload.user_id)
+            return change_project_owner(db, project, payload.user_id, shard)
 
     db.commit()
     db.refresh(project)
@@ -425,15 +483,57 @@ def update_project(
 def delete_project(
     project_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_project_db),
 ):
     project = db.get(Project, project_id)
-    if not project or project.is_deleted:
+    if (
+        not project
+        or project.is_deleted
+        or (not current_user.admin and project.user_id != current_user.id)
+    ):
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if not current_user.admin and project.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-
     project.is_deleted = True
+    record_project_change(db, project.user_id, projects=-1, data_bytes=-data_size(project.data))
     db.commit()
     return Response(status_code=204)
+
+
+@app.get("/admin/stats", response_model=AdminStatsOut)
+def admin_stats(_: User = Depends(get_admin_user), db: Session = Depends(get_user_db)):
+    users = (
+        db.query(User.id, User.username)
+        .filter(User.is_deleted.is_(False))
+        .order_by(User.id)
+        .all()
+    )
+    per_user: dict[int, UserStatsOut] = {
+        user.id: UserStatsOut(
+            user_id=user.id,
+            username=user.username,
+            project_count=0,
+            data_bytes=0,
+            last_activity=None,
+        )
+        for user in users
+    }
+    for stats in fan_out_owned(db, lambda shard_db: shard_db.query(ProjectStats).all()):
+        entry = per_user.get(stats.user_id)
+        if entry is None:
+            continue
+        entry.project_count += stats.project_count
+        entry.data_bytes += stats.data_bytes
+        if stats.last_activity and (
+            entry.last_activity is None or stats.last_activity > entry.last_activity
+        ):
+            entry.last_activity = stats.last_activity
+
+    entries = list(per_user.values())
+    activity = [entry.last_activity for entry in entries if entry.last_activity]
+    return AdminStatsOut(
+        users=entries,
+        total_users=len(entries),
+        total_projects=sum(entry.project_count for entry in entries),
+        total_data_bytes=sum(entry.data_bytes for entry in entries),
+        last_activity=max(activity, default=None),
+    )
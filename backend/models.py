@@ -1,7 +1,10 @@
-from sqlalchemy import Boolean, ForeignKey, Integer, String, Text
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from datetime import datetime
+from typing import Optional
 
-from app.database import Base
+from sqlalchemy import BigInteger, Boolean, DateTime, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base, ShardBase
 
 
 class User(Base):
@@ -15,18 +18,40 @@ class User(Base):
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
     protected_admin: Mapped[bool] = mapped_column(Boolean, default=False)
 
-    projects: Mapped[list["Project"]] = relationship(
-        "Project", back_populates="owner", cascade="all, delete-orphan"
-    )
 
+class ShardAssignment(Base):
+    __tablename__ = "shard_assignments"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, index=True)
+    migrating: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+class ProjectId(Base):
+    """Global project id sequence, so ids stay unique across shards."""
+
+    __tablename__ = "project_ids"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-class Project(Base):
+
+class Project(ShardBase):
     __tablename__ = "projects"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
     name: Mapped[str] = mapped_column(String(255), index=True)
     data: Mapped[str] = mapped_column(Text, default="")
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), index=True)
+    # Owners live in the primary database, so there is no cross-database foreign key.
+    user_id: Mapped[int] = mapped_column(Integer, index=True)
     is_deleted: Mapped[bool] = mapped_column(Boolean, default=False)
 
-    owner: Mapped[User] = relationship("User", back_populates="projects")
+
+class ProjectStats(ShardBase):
+    """Per-user project counters, kept next to the projects they describe."""
+
+    __tablename__ = "project_stats"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    project_count: Mapped[int] = mapped_column(Integer, default=0)
+    data_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    last_activity: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,124 @@
+"""Inspect and rebalance project shards.
+
+    python -m app.rebalance status
+    python -m app.rebalance pin
+    python -m app.rebalance move <user_id> <shard>
+    python -m app.rebalance rebalance
+
+Run ``pin`` before changing SHARD_URLS so existing users stay on the shard
+that holds their projects, then ``rebalance`` with the new configuration to
+move them to their new home shard one at a time. Shards are numbered by
+their position in SHARD_URLS: to retire one, move its users off while its
+URL is still listed, and only remove URLs from the end of the list.
+"""
+
+import argparse
+from collections import Counter
+
+from app.database import Base, SessionLocal, ShardBase, ShardSessions, engine, shard_engines
+from app.models import ShardAssignment, User
+from app.sharding import (
+    ShardBusyError,
+    ShardNotConfiguredError,
+    home_shard,
+    move_user,
+    resolve_shard,
+)
+
+
+def status() -> None:
+    db = SessionLocal()
+    try:
+        counts = Counter(shard for (shard,) in db.query(ShardAssignment.shard).all())
+    finally:
+        db.close()
+    for shard in range(len(ShardSessions)):
+        print(f"shard {shard}: {counts.pop(shard, 0)} users")
+    for shard, count in sorted(counts.items()):
+        print(f"shard {shard} (not configured): {count} users")
+
+
+def pin() -> None:
+    db = SessionLocal()
+    try:
+        pinned = {user_id for (user_id,) in db.query(ShardAssignment.user_id).all()}
+        user_ids = [user_id for (user_id,) in db.query(User.id).all() if user_id not in pinned]
+        for user_id in user_ids:
+            resolve_shard(db, user_id)
+    finally:
+        db.close()
+    print(f"Pinned {len(user_ids)} users")
+
+
+def move(user_id: int, shard: int, grace: float) -> None:
+    if not 0 <= shard < len(ShardSessions):
+        raise SystemExit(f"Shard {shard} is not configured")
+    try:
+        moved = move_user(user_id, shard, grace)
+    except ShardBusyError as exc:
+        raise SystemExit(str(exc)) from exc
+    except ShardNotConfiguredError as exc:
+        raise SystemExit(
+            f"{exc}. Its projects cannot be read: add the shard URL back to SHARD_URLS "
+            "at the same position, then move the user."
+        ) from exc
+    print(f"User {user_id}: moved {moved} projects to shard {shard}")
+
+
+def rebalance(grace: float) -> None:
+    db = SessionLocal()
+    try:
+        assignments = db.query(ShardAssignment).all()
+    finally:
+        db.close()
+    stranded = sorted(
+        assignment.user_id for assignment in assignments if assignment.shard >= len(ShardSessions)
+    )
+    if stranded:
+        raise SystemExit(
+            f"Users {stranded} are assigned to shards missing from SHARD_URLS. Add those shard "
+            "URLs back at the same positions before rebalancing."
+        )
+    misplaced = [
+        (assignment.user_id, home_shard(assignment.user_id))
+        for assignment in assignments
+        if assignment.shard != home_shard(assignment.user_id)
+    ]
+    for user_id, shard in misplaced:
+        move(user_id, shard, grace)
+    print(f"Rebalanced {len(misplaced)} users")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=2.0,
+        help="seconds to wait for in-flight requests before the final copy",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show how many users each shard holds")
+    commands.add_parser("pin", help="pin every user to their current shard")
+    move_parser = commands.add_parser("move", help="move one user to another shard")
+    move_parser.add_argument("user_id", type=int)
+    move_parser.add_argument("shard", type=int)
+    commands.add_parser("rebalance", help="move users whose home shard changed")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    for shard_engine in shard_engines:
+        ShardBase.metadata.create_all(bind=shard_engine)
+
+    if args.command == "status":
+        status()
+    elif args.command == "pin":
+        pin()
+    elif args.command == "move":
+        move(args.user_id, args.shard, args.grace)
+    else:
+        rebalance(args.grace)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field
@@ -61,3 +62,19 @@ class MeOut(BaseModel):
     username: str
     email: EmailStr
     admin: bool
+
+
+class UserStatsOut(BaseModel):
+    user_id: int
+    username: str
+    project_count: int
+    data_bytes: int
+    last_activity: Optional[datetime]
+
+
+class AdminStatsOut(BaseModel):
+    users: list[UserStatsOut]
+    total_users: int
+    total_projects: int
+    total_data_bytes: int
+    last_activity: Optional[datetime]
@@ -0,0 +1,231 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, TypeVar
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, ShardSessions, shard_engines
+from app.models import Project, ProjectId, ProjectStats, ShardAssignment
+from app.stats import data_size, record_project_change
+
+T = TypeVar("T")
+
+
+class ShardBusyError(Exception):
+    pass
+
+
+class ShardNotConfiguredError(Exception):
+    pass
+
+
+def home_shard(user_id: int) -> int:
+    # Stable across processes and restarts, unlike the builtin hash().
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % len(ShardSessions)
+
+
+def resolve_shard(db: Session, user_id: int) -> int:
+    """Return the shard holding the user's projects, pinning the user on first use."""
+    assignment = db.get(ShardAssignment, user_id)
+    if assignment is None:
+        assignment = ShardAssignment(user_id=user_id, shard=home_shard(user_id), migrating=False)
+        db.add(assignment)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request pinned the user concurrently.
+            db.rollback()
+            assignment = db.get(ShardAssignment, user_id)
+    if assignment.migrating:
+        raise ShardBusyError(f"Projects of user {user_id} are being moved")
+    if assignment.shard >= len(ShardSessions):
+        raise ShardNotConfiguredError(
+            f"User {user_id} is assigned to shard {assignment.shard}, which is not in SHARD_URLS"
+        )
+    return assignment.shard
+
+
+@contextmanager
+def shard_session(shard: int) -> Iterator[Session]:
+    db = ShardSessions[shard]()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _run_on_shards(run: Callable[[int], list[T]]) -> list[T]:
+    if len(ShardSessions) == 1:
+        return run(0)
+    with ThreadPoolExecutor(max_workers=len(ShardSessions)) as pool:
+        results = pool.map(run, range(len(ShardSessions)))
+        return [item for shard_results in results for item in shard_results]
+
+
+def fan_out(query: Callable[[Session], list[T]]) -> list[T]:
+    """Run ``query`` against every shard in parallel and concatenate the results."""
+
+    def run(shard: int) -> list[T]:
+        with shard_session(shard) as db:
+            return query(db)
+
+    return _run_on_shards(run)
+
+
+def fan_out_owned(user_db: Session, query: Callable[[Session], list[T]]) -> list[T]:
+    """Like :func:`fan_out`, keeping only rows on their owner's assigned shard.
+
+    While a user is being moved their rows exist on two shards; the copy on
+    the shard they are not assigned to is skipped.
+    """
+    assignments = dict(user_db.query(ShardAssignment.user_id, ShardAssignment.shard).all())
+
+    def run(shard: int) -> list[T]:
+        with shard_session(shard) as db:
+            return [row for row in query(db) if assignments.get(row.user_id, shard) == shard]
+
+    return _run_on_shards(run)
+
+
+def find_project_owner(project_id: int) -> Optional[int]:
+    owners = fan_out(
+        lambda db: db.query(Project.user_id).filter(Project.id == project_id).all()
+    )
+    return owners[0].user_id if owners else None
+
+
+def allocate_project_id(db: Session) -> int:
+    row = ProjectId()
+    db.add(row)
+    db.flush()
+    project_id = row.id
+    db.commit()
+    return project_id
+
+
+def seed_project_ids(db: Session) -> None:
+    """Start the id sequence after the projects that already exist on the shards."""
+    highest = max(
+        fan_out(lambda shard_db: [shard_db.query(func.max(Project.id)).scalar() or 0])
+    )
+    current = db.query(func.max(ProjectId.id)).scalar() or 0
+    if highest <= current:
+        return
+    db.add(ProjectId(id=highest))
+    try:
+        db.flush()
+        if db.get_bind().dialect.name == "postgresql":
+            # Explicit ids do not advance a PostgreSQL sequence.
+            db.execute(
+                text("SELECT setval(pg_get_serial_sequence('project_ids', 'id'), :id)"),
+                {"id": highest},
+            )
+        db.commit()
+    except IntegrityError:
+        # Another process starting at the same time seeded the sequence.
+        db.rollback()
+
+
+def _copy_projects(user_id: int, source: int, target: int, final: bool = False) -> int:
+    """Copy a user's projects to ``target``.
+
+    The final pass, run while the user is migrating, replaces whatever an
+    earlier pass left on the target and carries the counters over.
+    """
+    with shard_session(source) as src, shard_session(target) as dst:
+        if final:
+            dst.query(Project).filter(Project.user_id == user_id).delete()
+            dst.query(ProjectStats).filter(ProjectStats.user_id == user_id).delete()
+        projects = src.query(Project).filter(Project.user_id == user_id).all()
+        for project in projects:
+            dst.merge(
+                Project(
+                    id=project.id,
+                    name=project.name,
+                    data=project.data,
+                    user_id=project.user_id,
+                    is_deleted=project.is_deleted,
+                )
+            )
+        stats = src.get(ProjectStats, user_id) if final else None
+        if stats is not None:
+            dst.merge(
+                ProjectStats(
+                    user_id=user_id,
+                    project_count=stats.project_count,
+                    data_bytes=stats.data_bytes,
+                    last_activity=stats.last_activity,
+                )
+            )
+        dst.commit()
+        return len(projects)
+
+
+def change_project_owner(db: Session, project: Project, owner_id: int, target: int) -> Project:
+    """Reassign ``project`` and move it to the ``target`` shard when it lives elsewhere."""
+    size = data_size(project.data)
+    record_project_change(db, project.user_id, projects=-1, data_bytes=-size)
+    project.user_id = owner_id
+    if db.get_bind() is shard_engines[target]:
+        record_project_change(db, owner_id, projects=1, data_bytes=size)
+        db.commit()
+        return project
+
+    with shard_session(target) as dst:
+        moved = dst.merge(
+            Project(
+                id=project.id,
+                name=project.name,
+                data=project.data,
+                user_id=owner_id,
+                is_deleted=project.is_deleted,
+            )
+        )
+        record_project_change(dst, owner_id, projects=1, data_bytes=size)
+        dst.commit()
+        dst.refresh(moved)
+        dst.expunge(moved)
+    db.delete(project)
+    db.commit()
+    return moved
+
+
+def move_user(user_id: int, target: int, grace: float = 2.0) -> int:
+    """Move a user's projects to ``target`` while the application keeps serving.
+
+    Projects are copied once while the user keeps working, then the user is
+    briefly marked as migrating (project requests get a 503), the changes made
+    in the meantime are copied again and the assignment is switched over.
+    """
+    user_db = SessionLocal()
+    try:
+        source = resolve_shard(user_db, user_id)
+        if source == target:
+            return 0
+
+        _copy_projects(user_id, source, target)
+
+        assignment = user_db.get(ShardAssignment, user_id)
+        assignment.migrating = True
+        user_db.commit()
+        try:
+            # Let requests that resolved the source shard before the switch finish.
+            time.sleep(grace)
+            moved = _copy_projects(user_id, source, target, final=True)
+            assignment.shard = target
+        finally:
+            assignment.migrating = False
+            user_db.commit()
+
+        with shard_session(source) as db:
+            db.query(Project).filter(Project.user_id == user_id).delete()
+            db.query(ProjectStats).filter(ProjectStats.user_id == user_id).delete()
+            db.commit()
+        return moved
+    finally:
+        user_db.close()
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import LargeBinary, cast, func, insert, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import ShardSessions
+from app.models import Project, ProjectStats
+
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# Counter row that belongs to no user; reconciliation writes it to serialise runs.
+_RECONCILE_LOCK_USER_ID = 0
+
+
+def data_size(data: str) -> int:
+    return len(data.encode("utf-8"))
+
+
+def _add_to_stats(
+    db: Session,
+    user_id: int,
+    projects: int,
+    data_bytes: int,
+    last_activity: Optional[datetime] = None,
+) -> None:
+    """Add to a user's counters in SQL, creating the row if it is missing."""
+    values = {
+        "user_id": user_id,
+        "project_count": projects,
+        "data_bytes": data_bytes,
+        "last_activity": last_activity,
+    }
+    increments = {
+        "project_count": ProjectStats.project_count + projects,
+        "data_bytes": ProjectStats.data_bytes + data_bytes,
+    }
+    if last_activity is not None:
+        increments["last_activity"] = last_activity
+
+    dialect_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        db.execute(
+            dialect_insert(ProjectStats)
+            .values(**values)
+            .on_conflict_do_update(index_elements=[ProjectStats.user_id], set_=increments)
+        )
+        return
+
+    result = db.execute(
+        update(ProjectStats).where(ProjectStats.user_id == user_id).values(**increments)
+    )
+    if result.rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(ProjectStats).values(**values))
+    except IntegrityError:
+        # Another transaction created the row concurrently.
+        db.execute(
+            update(ProjectStats).where(ProjectStats.user_id == user_id).values(**increments)
+        )
+
+
+def record_project_change(db: Session, user_id: int, projects: int = 0, data_bytes: int = 0) -> None:
+    """Adjust the owner's counters as part of the caller's transaction."""
+    _add_to_stats(db, user_id, projects, data_bytes, datetime.now(timezone.utc))
+
+
+def _data_bytes(db: Session):
+    # Casting text to bytea on PostgreSQL parses backslash escapes, so only
+    # SQLite, which lacks octet_length before 3.43, measures through a BLOB cast.
+    if db.get_bind().dialect.name == "sqlite":
+        return func.length(cast(Project.data, LargeBinary))
+    return func.octet_length(Project.data)
+
+
+def reconcile_stats() -> None:
+    """Correct every counter from the projects tables, shard by shard.
+
+    Counters and totals are read in a single statement and the difference is
+    added to the counters, so changes committed in the meantime are kept.
+    Every run first writes the lock row, which holds a row lock (PostgreSQL)
+    or the database write lock (SQLite) until commit. Runs from several
+    processes therefore take turns, and each one reads the drift left by the
+    previous run instead of applying the same correction twice.
+    """
+    for session_factory in ShardSessions:
+        db = session_factory()
+        try:
+            _add_to_stats(db, _RECONCILE_LOCK_USER_ID, 0, 0, datetime.now(timezone.utc))
+            totals = (
+                select(
+                    Project.user_id,
+                    func.count(Project.id).label("project_count"),
+                    func.coalesce(func.sum(_data_bytes(db)), 0).label("data_bytes"),
+                )
+                .where(Project.is_deleted.is_(False))
+                .group_by(Project.user_id)
+                .subquery()
+            )
+            drift = union_all(
+                select(
+                    ProjectStats.user_id,
+                    (func.coalesce(totals.c.project_count, 0) - ProjectStats.project_count).label(
+                        "project_count"
+                    ),
+                    (func.coalesce(totals.c.data_bytes, 0) - ProjectStats.data_bytes).label(
+                        "data_bytes"
+                    ),
+                ).outerjoin(totals, totals.c.user_id == ProjectStats.user_id),
+                select(totals.c.user_id, totals.c.project_count, totals.c.data_bytes)
+                .outerjoin(ProjectStats, ProjectStats.user_id == totals.c.user_id)
+                .where(ProjectStats.user_id.is_(None)),
+            )
+            for user_id, projects, data_bytes in db.execute(drift).all():
+                if projects or data_bytes:
+                    _add_to_stats(db, user_id, projects, data_bytes)
+            db.commit()
+        finally:
+            db.close()
+
+
+async def reconcile_stats_periodically(interval: int) -> None:
+    while True:
+        try:
+            await asyncio.to_thread(reconcile_stats)
+        except Exception as exc:
+            print(f"[stats] Reconciliation failed: {exc}")
+        await asyncio.sleep(interval)